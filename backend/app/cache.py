@@ -0,0 +1,44 @@
+"""
+Semantic Cache — Reuse results for near-duplicate queries.
+
+Entries are keyed by the L2-normalised query embedding; a lookup hits when
+the closest stored key has cosine similarity >= the threshold. Keys live in
+a fixed-size ring buffer, so the oldest entry is evicted once full.
+"""
+
+import threading
+import numpy as np
+from app.config import EMBEDDING_DIM
+
+
+class SemanticCache:
+    """Fixed-capacity cache of values keyed by normalised query embeddings."""
+
+    def __init__(self, capacity: int, threshold: float):
+        self.threshold = threshold
+        self._keys = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._values: list = [None] * capacity
+        self._size = 0
+        self._next = 0   # ring-buffer slot written by the next put()
+        self._lock = threading.Lock()
+
+    def get(self, query_vec: np.ndarray):
+        """Return the value stored for the most similar key, or None on a miss."""
+        with self._lock:
+            if not self._size:
+                return None
+            # Keys and query are normalised, so the dot product is cosine similarity
+            scores = self._keys[:self._size] @ query_vec.reshape(-1)
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                return None
+            return self._values[best]
+
+    def put(self, query_vec: np.ndarray, value) -> None:
+        """Store a value, evicting the oldest entry when full."""
+        with self._lock:
+            slot = self._next
+            self._keys[slot] = query_vec.reshape(-1)
+            self._values[slot] = value
+            self._next = (slot + 1) % len(self._values)
+            self._size = min(self._size + 1, len(self._values))
@@ -0,0 +1,46 @@
+"""
+Chunk Store — Columnar in-memory chunk metadata.
+
+One row per chunk, row-aligned with the FAISS index and the stored vectors.
+Numeric fields live in int32 arrays and each filename is stored once in a
+small id → name table, so no per-chunk dicts are kept around. Retrieval
+results carry only the row index; metadata is looked up here on demand.
+"""
+
+import sys
+from dataclasses import dataclass, field
+import numpy as np
+
+
+@dataclass
+class ChunkStore:
+    source_file_id: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    page_number: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    chunk_index: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    section_heading: list[str] = field(default_factory=list)
+    text: list[str] = field(default_factory=list)
+    filenames: list[str] = field(default_factory=list)   # source_file_id → filename
+
+    @classmethod
+    def from_dicts(cls, chunks: list[dict]) -> "ChunkStore":
+        """Build the columns from chunk dicts (as produced by the chunker / stored on disk)."""
+        file_ids: dict[str, int] = {}
+        source_ids = [
+            file_ids.setdefault(sys.intern(c["source_file"]), len(file_ids)) for c in chunks
+        ]
+        return cls(
+            source_file_id=np.array(source_ids, dtype=np.int32),
+            page_number=np.array([c["page_number"] for c in chunks], dtype=np.int32),
+            chunk_index=np.array([c.get("chunk_index", 0) for c in chunks], dtype=np.int32),
+            # Headings repeat across every chunk of a section
+            section_heading=[sys.intern(c.get("section_heading", "")) for c in chunks],
+            text=[c["text"] for c in chunks],
+            filenames=list(file_ids),
+        )
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def source_file(self, idx: int) -> str:
+        """Filename of the chunk at row idx."""
+        return self.filenames[self.source_file_id[idx]]
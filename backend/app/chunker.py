@@ -4,14 +4,14 @@ Takes raw blocks from the PDF parser and produces smaller, embedding-ready chunk
 """
 
 import re
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from app.config import MAX_CHUNK_SIZE, OVERLAP_SENTENCES
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Sentence splitter: split on period/exclamation/question followed by space or EOL
-_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Sentence boundary: period/exclamation/question followed by whitespace
+_SENTENCE_END_RE = re.compile(r"[.!?]\s+")
 
 
 def chunk_blocks(blocks: list[dict]) -> list[dict]:
@@ -19,7 +19,7 @@ def chunk_blocks(blocks: list[dict]) -> list[dict]:
     Take the raw blocks from pdf_parser and produce final chunks.
 
     Strategy:
-    1. Group blocks by (source_file, page_number) to maintain page locality.
+    1. Keep blocks in document/page order to maintain page locality.
     2. If a block's text exceeds MAX_CHUNK_SIZE, split it on sentence boundaries.
     3. Add OVERLAP_SENTENCES boundary sentences from the end of one chunk
        to the beginning of the next chunk (within the same document).
@@ -27,78 +27,115 @@ def chunk_blocks(blocks: list[dict]) -> list[dict]:
     if not blocks:
         return []
 
-    # Step 1: split oversized blocks into sentence-level sub-chunks
-    split_chunks = _split_oversized_blocks(blocks)
-
-    # Step 2: add overlap between consecutive chunks of the same document
-    final_chunks = _add_overlap(split_chunks)
-
-    # Re-index chunk_index per file
-    file_counters: dict[str, int] = {}
-    for chunk in final_chunks:
-        fname = chunk["source_file"]
-        idx = file_counters.get(fname, 0)
-        chunk["chunk_index"] = idx
-        file_counters[fname] = idx + 1
+    final_chunks = list(iter_chunks(blocks))
 
     logger.info("Chunking complete: %d blocks → %d chunks", len(blocks), len(final_chunks))
     return final_chunks
 
 
-def _split_oversized_blocks(blocks: list[dict]) -> list[dict]:
-    """Split any block whose text exceeds MAX_CHUNK_SIZE on sentence boundaries."""
-    result: list[dict] = []
+def iter_chunks(blocks: Iterable[dict]) -> Iterator[dict]:
+    """
+    Single streaming pass behind chunk_blocks: each chunk is split, given its
+    overlap and its per-file chunk_index as it is emitted, with no
+    intermediate lists or copies.
+    """
+    file_counters: dict[str, int] = {}
+    prev_file: str | None = None
+    prev_text = ""
+    prev_sentences: list[str] | None = None
 
     for block in blocks:
-        text = block["text"]
-        if len(text) <= MAX_CHUNK_SIZE:
-            result.append(block.copy())
-            continue
-
-        # Split into sentences
-        sentences = _SENTENCE_RE.split(text)
-        current_text = ""
-        for sent in sentences:
-            if current_text and len(current_text) + len(sent) + 1 > MAX_CHUNK_SIZE:
-                result.append({
-                    **block,
-                    "text": current_text.strip(),
-                })
-                current_text = sent
-            else:
-                current_text = (current_text + " " + sent).strip() if current_text else sent
-
-        if current_text.strip():
-            result.append({
-                **block,
-                "text": current_text.strip(),
-            })
-
-    return result
-
-
-def _add_overlap(chunks: list[dict]) -> list[dict]:
+        fname = block["source_file"]
+
+        for text, sentences in _iter_block_pieces(block["text"]):
+            chunk = {**block, "text": text}
+
+            # Only add overlap within the same document
+            if OVERLAP_SENTENCES > 0 and fname == prev_file:
+                # Pieces of split blocks carry their sentences; only blocks
+                # that were already small enough need splitting here
+                if prev_sentences is None:
+                    prev_sentences = _split_sentences(prev_text)
+                overlap = prev_sentences[-OVERLAP_SENTENCES:]
+                if overlap:
+                    chunk["text"] = " ".join([*overlap, text])
+
+            idx = file_counters.get(fname, 0)
+            chunk["chunk_index"] = idx
+            file_counters[fname] = idx + 1
+
+            prev_file, prev_text, prev_sentences = fname, text, sentences
+            yield chunk
+
+
+def _iter_block_pieces(text: str) -> Iterator[tuple[str, list[str] | None]]:
+    """
+    Yield (text, sentences) for each piece of a block: the block itself if it
+    fits in MAX_CHUNK_SIZE (sentences not computed), otherwise sentence-packed
+    sub-chunks.
+    """
+    if len(text) <= MAX_CHUNK_SIZE:
+        yield text, None
+        return
+
+    # Pack sentences into chunks by span length, then build each
+    # chunk's text with a single join
+    spans = [(lo, hi) for lo, hi in _iter_sentence_spans(text) if lo != hi]
+    sentences = [text[lo:hi] for lo, hi in spans]
+    for first, stop in pack_sentence_spans(spans, MAX_CHUNK_SIZE):
+        buf = sentences[first:stop]
+        yield " ".join(buf), buf
+
+
+def _iter_sentence_spans(text: str) -> Iterator[tuple[int, int]]:
     """
-    For consecutive chunks from the same source file, prepend the last
-    OVERLAP_SENTENCES sentences of the previous chunk to the current one.
+    Yield (lo, hi) index spans of the sentences in *text*.
+
+    Equivalent to splitting on r"(?<=[.!?])\\s+": a boundary is a terminator
+    followed by whitespace, and the whitespace run belongs to neither side.
+    One C-level finditer scan yields the boundaries as integers, with no
+    lookbehind and no per-sentence string allocation.
     """
-    if not chunks or OVERLAP_SENTENCES <= 0:
-        return chunks
+    lo = 0
+    for m in _SENTENCE_END_RE.finditer(text):
+        yield lo, m.start() + 1
+        lo = m.end()
+    yield lo, len(text)
 
-    result: list[dict] = [chunks[0].copy()]
 
-    for i in range(1, len(chunks)):
-        current = chunks[i].copy()
-        prev = chunks[i - 1]
+def _split_sentences(text: str) -> list[str]:
+    """Return the non-empty sentences of *text*."""
+    return [text[lo:hi] for lo, hi in _iter_sentence_spans(text) if lo != hi]
 
-        # Only add overlap within the same document
-        if current["source_file"] == prev["source_file"]:
-            prev_sentences = _SENTENCE_RE.split(prev["text"])
-            overlap = prev_sentences[-OVERLAP_SENTENCES:]
-            if overlap:
-                overlap_text = " ".join(overlap).strip()
-                current["text"] = overlap_text + " " + current["text"]
 
-        result.append(current)
+def _pack_sentence_spans(spans: list[tuple[int, int]], max_size: int) -> list[tuple[int, int]]:
+    """
+    Group consecutive (lo, hi) sentence spans into chunks whose space-joined
+    length stays within max_size (a single longer sentence forms its own chunk).
+    Returns (first, stop) index ranges into *spans*.
 
-    return result
+    Pure-Python twin of chunker_fast.pack_sentence_spans.
+    """
+    groups: list[tuple[int, int]] = []
+    first = 0
+    buf_len = 0
+    for i, (lo, hi) in enumerate(spans):
+        length = hi - lo
+        added = length + (1 if i > first else 0)
+        if i > first and buf_len + added > max_size:
+            groups.append((first, i))
+            first = i
+            buf_len = length
+        else:
+            buf_len += added
+
+    if len(spans) > first:
+        groups.append((first, len(spans)))
+    return groups
+
+
+# Prefer the compiled packer when it has been built (cythonize -i app/chunker_fast.pyx)
+try:
+    from app.chunker_fast import pack_sentence_spans
+except ImportError:
+    pack_sentence_spans = _pack_sentence_spans
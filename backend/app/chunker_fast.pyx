@@ -0,0 +1,36 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled sentence packer for app.chunker.
+
+Build in place with:  cythonize -i app/chunker_fast.pyx
+app.chunker falls back to its identical pure-Python loop when this
+extension hasn't been built.
+"""
+
+
+cpdef list pack_sentence_spans(list spans, Py_ssize_t max_size):
+    """
+    Group consecutive (lo, hi) sentence spans into chunks whose space-joined
+    length stays within max_size (a single longer sentence forms its own chunk).
+    Returns (first, stop) index ranges into *spans*.
+    """
+    cdef list groups = []
+    cdef Py_ssize_t n = len(spans)
+    cdef Py_ssize_t i, lo, hi, length, added
+    cdef Py_ssize_t first = 0
+    cdef Py_ssize_t buf_len = 0
+
+    for i in range(n):
+        lo, hi = spans[i]
+        length = hi - lo
+        added = length + (1 if i > first else 0)
+        if i > first and buf_len + added > max_size:
+            groups.append((first, i))
+            first = i
+            buf_len = length
+        else:
+            buf_len += added
+
+    if n > first:
+        groups.append((first, n))
+    return groups
@@ -10,17 +10,27 @@ PROJECT_ROOT = Path(os.getenv("PROJECT_ROOT", BASE_DIR.parent))
 DOCS_DIR = PROJECT_ROOT / "clearpath_docs"
 INDEX_DIR = BASE_DIR / "data"
 FAISS_INDEX_PATH = INDEX_DIR / "faiss_index.bin"
-CHUNKS_PATH = INDEX_DIR / "chunks.json"
+CHUNKS_PATH = INDEX_DIR / "chunks.json"            # human-readable copy
+CHUNKS_MSGPACK_PATH = INDEX_DIR / "chunks.msgpack"  # loaded on startup
+EMBEDDINGS_PATH = INDEX_DIR / "embeddings.npy"
 CONVERSATIONS_PATH = INDEX_DIR / "conversations.json"
+CONVERSATIONS_LOG_PATH = INDEX_DIR / "conversations.log"
 
 # ── Groq ───────────────────────────────────────────────────────────────
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+GROQ_CHAT_COMPLETIONS_URL = "https://api.groq.com/openai/v1/chat/completions"
 SIMPLE_MODEL = "llama-3.1-8b-instant"
 COMPLEX_MODEL = "llama-3.3-70b-versatile"
 
 # ── Embedding ──────────────────────────────────────────────────────────
 EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
 EMBEDDING_DIM = 384
+ONNX_MODEL_DIR = BASE_DIR / "onnx_model"   # exported by download_model.py; optional
+ONNX_MAX_SEQ_LENGTH = 512                  # matches the sentence-transformers config
+EMBEDDING_BATCH_SIZE = 64
+QUERY_CACHE_SIZE = 512        # LRU entries for repeated query strings
+QUERY_BATCH_WINDOW_S = 0.005  # how long concurrent retrieval queries are coalesced
+QUERY_BATCH_MAX = 32          # max queries per coalesced forward pass
 
 # ── Chunking ──────────────────────────────────────────────────────────
 MAX_CHUNK_SIZE = 512          # approx characters
@@ -28,6 +38,15 @@ OVERLAP_SENTENCES = 3         # boundary sentences carried to next chunk
 
 # ── Retrieval ─────────────────────────────────────────────────────────
 TOP_K = 5
+IVF_MIN_VECTORS = 1000        # below this, exact numpy search beats FAISS per-query overhead
+IVF_PQ_MIN_VECTORS = 10_000   # from here, product-quantise the inverted lists
+IVF_NPROBE = 8                # inverted lists scanned per query
+
+# ── Caching ───────────────────────────────────────────────────────────
+CLASSIFY_CACHE_SIZE = 2048            # exact-match LRU entries for query routing
+PROMPT_CACHE_SIZE = 512               # rendered context messages, keyed by chunk set
+SEMANTIC_CACHE_SIZE = 256             # recent queries kept per semantic cache
+SEMANTIC_CACHE_THRESHOLD = 0.97       # query cosine sim at/above this → cache hit
 
 # ── Router ────────────────────────────────────────────────────────────
 COMPLEXITY_THRESHOLD = 3      # additive score >= this → complex
@@ -38,3 +57,4 @@ GROUNDING_THRESHOLD = 0.35    # cosine sim below this → low_grounding flag
 
 # ── Conversation ──────────────────────────────────────────────────────
 MAX_HISTORY_MESSAGES = 10
+CONVERSATION_COMPACT_EVERY = 200   # logged mutations before the snapshot is rewritten
@@ -11,9 +11,19 @@ Token cost tradeoff:
   - Fits within 8K context window of llama-3.1-8b-instant
 """
 
+import atexit
+import os
+import queue
+import threading
 import uuid
-import json
-from app.config import MAX_HISTORY_MESSAGES, CONVERSATIONS_PATH
+from collections import deque
+import orjson
+from app.config import (
+    MAX_HISTORY_MESSAGES,
+    CONVERSATIONS_PATH,
+    CONVERSATIONS_LOG_PATH,
+    CONVERSATION_COMPACT_EVERY,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,51 +31,213 @@ logger = logging.getLogger(__name__)
 # In-memory cache + persistent store
 _conversations: dict[str, dict] = {}
 
+# session_id → conversation ids in creation order, so listing a session's
+# sidebar touches only its own conversations
+_session_index: dict[str | None, list[str]] = {}
+
 MAX_HISTORY_TURNS = MAX_HISTORY_MESSAGES // 2
+MAX_MESSAGES = MAX_HISTORY_TURNS * 2   # preserve user+assistant pairs
+
+# Persistence: a JSON snapshot plus an append-only log of mutations since it
+# was written. Mutators only enqueue their event; a daemon writer thread
+# appends queued events in batches and rewrites the snapshot (truncating the
+# log) every CONVERSATION_COMPACT_EVERY events, keeping disk I/O off the
+# request path.
+#
+# _lock guards the store. Mutations are applied and their events enqueued
+# under it, so whatever is still queued is always already reflected in memory.
+_lock = threading.Lock()
+_write_q: queue.Queue = queue.Queue()
+_pending_events = 0   # events in the log since the last snapshot (writer-owned)
+
+
+def _append_event(event: dict) -> None:
+    """Queue one mutation for the background writer. Caller holds _lock."""
+    _write_q.put_nowait(event)
+
+
+def _writer_loop() -> None:
+    """Drain the event queue, coalescing bursts into a single append."""
+    while True:
+        events = [_write_q.get()]
+        while True:
+            try:
+                events.append(_write_q.get_nowait())
+            except queue.Empty:
+                break
+
+        if None in events:   # shutdown sentinel: log what arrived with it, then stop
+            events = [event for event in events if event is not None]
+            if events:
+                _write_events(events)
+            return
+
+        _write_events(events)
+        if _pending_events >= CONVERSATION_COMPACT_EVERY:
+            _save_to_disk()
+
+
+def _write_events(events: list[dict]) -> None:
+    """Append a batch of mutations to the log, one JSON line each."""
+    global _pending_events
+    try:
+        CONVERSATIONS_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(CONVERSATIONS_LOG_PATH, "ab") as f:
+            f.write(b"".join(orjson.dumps(event) + b"\n" for event in events))
+        _pending_events += len(events)
+    except Exception as e:
+        logger.error("Failed to log conversation events: %s", e)
 
 
 def _save_to_disk():
-    """Save the current conversation state to disk."""
+    """Atomically write a full snapshot of the conversation state and truncate the log."""
+    global _pending_events
     try:
+        with _lock:
+            data = orjson.dumps(_conversations, default=_serialise, option=orjson.OPT_INDENT_2)
+            # Anything still queued is already part of this snapshot
+            _drain_queue()
+
         CONVERSATIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(CONVERSATIONS_PATH, "w", encoding="utf-8") as f:
-            json.dump(_conversations, f, ensure_ascii=False, indent=2)
+        tmp_path = CONVERSATIONS_PATH.with_suffix(".json.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, CONVERSATIONS_PATH)
+        CONVERSATIONS_LOG_PATH.write_bytes(b"")
+        _pending_events = 0
     except Exception as e:
         logger.error("Failed to save conversations: %s", e)
 
 
+def _drain_queue() -> None:
+    while True:
+        try:
+            _write_q.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _shutdown() -> None:
+    """Stop the writer and fold everything into a final snapshot."""
+    _write_q.put_nowait(None)
+    _writer.join(timeout=5)
+    # Nothing changed since the last snapshot: leave the files untouched
+    if _pending_events == 0 and _write_q.empty():
+        return
+    _save_to_disk()
+
+
+def _serialise(obj):
+    """orjson fallback: message windows are deques."""
+    if isinstance(obj, deque):
+        return list(obj)
+    raise TypeError
+
+
 def _load_from_disk():
-    """Load conversation state from disk on startup."""
+    """Load the snapshot from disk on startup, then replay the event log."""
     global _conversations
     if CONVERSATIONS_PATH.exists():
         try:
-            with open(CONVERSATIONS_PATH, "r", encoding="utf-8") as f:
-                _conversations = json.load(f)
+            _conversations = orjson.loads(CONVERSATIONS_PATH.read_bytes())
             logger.info("Loaded %d conversations from disk", len(_conversations))
         except Exception as e:
             logger.error("Failed to load conversations: %s", e)
             _conversations = {}
 
+    _session_index.clear()
+    for conv_id, conv in _conversations.items():
+        conv["messages"] = deque(conv["messages"], maxlen=MAX_MESSAGES)
+        _session_index.setdefault(conv.get("session_id"), []).append(conv_id)
+
+    if not CONVERSATIONS_LOG_PATH.exists():
+        return
+
+    replayed = 0
+    try:
+        with open(CONVERSATIONS_LOG_PATH, "rb") as f:
+            for line in f:
+                try:
+                    event = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # A torn final line from an interrupted write
+                    logger.warning("Skipping unreadable conversation log line")
+                    continue
+                _apply_event(event)
+                replayed += 1
+    except Exception as e:
+        logger.error("Failed to replay conversation log: %s", e)
+
+    if replayed:
+        logger.info("Replayed %d conversation events from log", replayed)
+        _save_to_disk()
+
+
+def _apply_event(event: dict) -> None:
+    """Apply a logged mutation to the in-memory store."""
+    op = event.get("op")
+    if op == "create":
+        _create(event["cid"], event.get("session_id"))
+    elif op == "add":
+        _add(event["cid"], event["msg"], event.get("session_id"))
+    elif op == "clear":
+        _clear(event["cid"])
+
+
+def _create(conversation_id: str, session_id: str | None) -> None:
+    _clear(conversation_id)
+    _conversations[conversation_id] = {
+        "title": "New conversation",
+        # Bounded window: appends evict the oldest message in O(1)
+        "messages": deque(maxlen=MAX_MESSAGES),
+        "session_id": session_id,
+    }
+    _session_index.setdefault(session_id, []).append(conversation_id)
+
 
-# Load on module import
+def _clear(conversation_id: str) -> None:
+    conv = _conversations.pop(conversation_id, None)
+    if conv is not None:
+        _session_index[conv.get("session_id")].remove(conversation_id)
+
+
+def _add(conversation_id: str, msg: dict, session_id: str | None) -> None:
+    if conversation_id not in _conversations:
+        _create(conversation_id, session_id)
+
+    conv = _conversations[conversation_id]
+    conv["messages"].append(msg)
+
+    # Ensure session_id is set if it was missing
+    if session_id and not conv.get("session_id"):
+        _session_index[conv.get("session_id")].remove(conversation_id)
+        _session_index.setdefault(session_id, []).append(conversation_id)
+        conv["session_id"] = session_id
+
+    # Set title from first user message
+    content = msg["content"]
+    if msg["role"] == "user" and conv["title"] == "New conversation":
+        conv["title"] = content[:50] + ("…" if len(content) > 50 else "")
+
+
+# Load on module import, then start the writer; snapshot again on exit
 _load_from_disk()
+_writer = threading.Thread(target=_writer_loop, name="conversation-writer", daemon=True)
+_writer.start()
+atexit.register(_shutdown)
 
 
 def get_or_create_id(conversation_id: str | None, session_id: str | None = None) -> str:
     """Return the provided ID or generate a new one."""
-    if conversation_id and conversation_id in _conversations:
-        return conversation_id
-
-    new_id = conversation_id or f"conv_{uuid.uuid4().hex[:12]}"
-    if new_id not in _conversations:
-        _conversations[new_id] = {
-            "title": "New conversation",
-            "messages": [],
-            "session_id": session_id,
-        }
-        _save_to_disk()
-        logger.info("Created new conversation: %s (session: %s)", new_id, session_id)
-    return new_id
+    with _lock:
+        if conversation_id and conversation_id in _conversations:
+            return conversation_id
+
+        new_id = conversation_id or f"conv_{uuid.uuid4().hex[:12]}"
+        if new_id not in _conversations:
+            _create(new_id, session_id)
+            _append_event({"op": "create", "cid": new_id, "session_id": session_id})
+            logger.info("Created new conversation: %s (session: %s)", new_id, session_id)
+        return new_id
 
 
 def add_message(
@@ -77,36 +249,15 @@ def add_message(
     session_id: str | None = None,
 ) -> None:
     """Append a message to the conversation history."""
-    if conversation_id not in _conversations:
-        _conversations[conversation_id] = {
-            "title": "New conversation", 
-            "messages": [],
-            "session_id": session_id,
-        }
-
     msg = {"role": role, "content": content}
     if sources is not None:
         msg["sources"] = sources
     if metadata is not None:
         msg["metadata"] = metadata
 
-    conv = _conversations[conversation_id]
-    conv["messages"].append(msg)
-    
-    # Ensure session_id is set if it was missing
-    if session_id and not conv.get("session_id"):
-        conv["session_id"] = session_id
-
-    # Set title from first user message
-    if role == "user" and conv["title"] == "New conversation":
-        conv["title"] = content[:50] + ("…" if len(content) > 50 else "")
-
-    # Trim to keep last N messages (preserve pairs)
-    max_msgs = MAX_HISTORY_TURNS * 2
-    if len(conv["messages"]) > max_msgs:
-        conv["messages"] = conv["messages"][-max_msgs:]
-
-    _save_to_disk()
+    with _lock:
+        _add(conversation_id, msg, session_id)
+        _append_event({"op": "add", "cid": conversation_id, "msg": msg, "session_id": session_id})
 
 
 def get_messages_for_llm(conversation_id: str) -> list[dict]:
@@ -114,44 +265,47 @@ def get_messages_for_llm(conversation_id: str) -> list[dict]:
     Return conversation history as a list of {role, content} dicts
     suitable for the LLM messages array. Only includes the last K turns.
     """
-    conv = _conversations.get(conversation_id)
-    if not conv or not conv["messages"]:
-        return []
+    with _lock:
+        conv = _conversations.get(conversation_id)
+        if not conv or not conv["messages"]:
+            return []
 
-    # Return only role + content (strip sources/metadata)
-    return [
-        {"role": m["role"], "content": m["content"]}
-        for m in conv["messages"]
-    ]
+        # Return only role + content (strip sources/metadata)
+        return [
+            {"role": m["role"], "content": m["content"]}
+            for m in conv["messages"]
+        ]
 
 
 def get_all_messages(conversation_id: str) -> list[dict]:
     """Return all messages for a conversation (includes sources/metadata for frontend)."""
-    conv = _conversations.get(conversation_id)
-    if not conv:
-        return []
-    return conv["messages"]
+    with _lock:
+        conv = _conversations.get(conversation_id)
+        if not conv:
+            return []
+        return list(conv["messages"])
 
 
 def list_conversations(session_id: str | None = None) -> list[dict]:
     """Return all conversations, optionally filtered by session_id."""
-    result = []
-    for conv_id, conv in _conversations.items():
-        # If session_id is provided, only show matches. 
+    with _lock:
+        # If session_id is provided, only show matches.
         # If session_id is None, show all (backward compatibility/admin view)
-        if session_id and conv.get("session_id") != session_id:
-            continue
-            
-        if conv["messages"]:  # Only list non-empty conversations
-            result.append({
+        conv_ids = _session_index.get(session_id, []) if session_id else list(_conversations)
+
+        return [
+            {
                 "id": conv_id,
-                "title": conv["title"],
-                "message_count": len(conv["messages"]),
-            })
-    return list(reversed(result))  # newest first
+                "title": _conversations[conv_id]["title"],
+                "message_count": len(_conversations[conv_id]["messages"]),
+            }
+            for conv_id in reversed(conv_ids)  # newest first
+            if _conversations[conv_id]["messages"]  # Only list non-empty conversations
+        ]
 
 
 def clear_conversation(conversation_id: str) -> None:
     """Remove a conversation from memory and disk."""
-    _conversations.pop(conversation_id, None)
-    _save_to_disk()
+    with _lock:
+        _clear(conversation_id)
+        _append_event({"op": "clear", "cid": conversation_id})
@@ -3,32 +3,125 @@ Embeddings — Sentence-Transformer embeddings + FAISS index management.
 Uses multi-qa-MiniLM-L6-cos-v1 (384 dimensions).
 """
 
-import json
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+import msgpack
+import orjson
 import numpy as np
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 from app.config import (
     EMBEDDING_MODEL,
     EMBEDDING_DIM,
+    ONNX_MODEL_DIR,
+    ONNX_MAX_SEQ_LENGTH,
+    EMBEDDING_BATCH_SIZE,
+    QUERY_CACHE_SIZE,
+    QUERY_BATCH_WINDOW_S,
+    QUERY_BATCH_MAX,
     FAISS_INDEX_PATH,
     CHUNKS_PATH,
+    CHUNKS_MSGPACK_PATH,
+    EMBEDDINGS_PATH,
     INDEX_DIR,
+    IVF_MIN_VECTORS,
+    IVF_PQ_MIN_VECTORS,
+    IVF_NPROBE,
 )
 import logging
 
+# ONNX Runtime runs the exported encoder as one native graph (with the CPU's
+# SIMD kernels) instead of op-by-op through PyTorch. Optional: without it, or
+# without an exported model, the sentence-transformers model is used.
+try:
+    import onnxruntime
+    from transformers import AutoTokenizer
+except ImportError:
+    onnxruntime = None
+
 logger = logging.getLogger(__name__)
 
 # Global model instance (loaded once)
-_model: SentenceTransformer | None = None
+_model: "SentenceTransformer | _OnnxEncoder | None" = None
+
+# Micro-batcher for retrieval queries (bound to the running event loop)
+_batch_queue: asyncio.Queue | None = None
+_batch_task: asyncio.Task | None = None
+
+# Exact-match LRU of query vectors, shared by embed_query and the batcher
+_query_cache: OrderedDict[str, bytes] = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+# L2-normalised chunk vectors, row-aligned with the chunks list (set on build/load)
+_chunk_vectors: np.ndarray | None = None
+
+
+class _OnnxEncoder:
+    """
+    ONNX Runtime port of the sentence-transformers encoder: tokenise, run
+    the transformer, mean-pool over the attention mask. encode() mirrors the
+    subset of SentenceTransformer.encode this module uses.
+    """
 
+    def __init__(self, model_dir: Path):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(
+            str(model_dir / "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
 
-def _get_model() -> SentenceTransformer:
-    """Lazy-load the embedding model."""
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        out = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self._tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in tokens.items() if k in self._input_names}
+            hidden = self._session.run(None, feeds)[0]        # (batch, seq, dim)
+
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            out[start:start + len(batch)] = pooled
+
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def _get_model() -> "SentenceTransformer | _OnnxEncoder":
+    """Lazy-load the embedding model, preferring the ONNX export when available."""
     global _model
     if _model is None:
-        logger.info("Loading embedding model: %s", EMBEDDING_MODEL)
-        _model = SentenceTransformer(EMBEDDING_MODEL)
+        if onnxruntime is not None and (ONNX_MODEL_DIR / "model.onnx").exists():
+            logger.info("Loading ONNX embedding model from %s", ONNX_MODEL_DIR)
+            _model = _OnnxEncoder(ONNX_MODEL_DIR)
+        else:
+            logger.info("Loading embedding model: %s", EMBEDDING_MODEL)
+            _model = SentenceTransformer(EMBEDDING_MODEL)
+            if torch.cuda.is_available():
+                # FP16 halves memory traffic on GPU; CPU inference stays FP32
+                _model.half()
     return _model
 
 
@@ -38,56 +131,239 @@ def embed_texts(texts: list[str]) -> np.ndarray:
     Returns: np.ndarray of shape (len(texts), EMBEDDING_DIM), L2-normalised.
     """
     model = _get_model()
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-    # L2 normalise so inner-product == cosine similarity
-    faiss.normalize_L2(embeddings)
-    return embeddings
+    # L2 normalised by the model so inner-product == cosine similarity
+    embeddings = model.encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=True,
+    )
+    # FAISS only accepts float32 (the model emits float16 when halved)
+    return embeddings.astype(np.float32, copy=False)
 
 
 def embed_query(text: str) -> np.ndarray:
-    """Embed a single query string, returns shape (1, EMBEDDING_DIM)."""
-    model = _get_model()
-    vec = model.encode([text], convert_to_numpy=True)
-    faiss.normalize_L2(vec)
+    """
+    Embed a single query string, returns shape (1, EMBEDDING_DIM).
+    Repeated strings are served from an LRU cache; each call gets its own copy.
+    """
+    vec = _cached_query_vec(text)
+    if vec is None:
+        vec = _encode_queries([text])
+        _cache_query_vec(text, vec[0])
     return vec
 
 
+def _cached_query_vec(text: str) -> np.ndarray | None:
+    """Look up a query vector in the LRU, shape (1, EMBEDDING_DIM), or None."""
+    with _query_cache_lock:
+        data = _query_cache.get(text)
+        if data is None:
+            return None
+        _query_cache.move_to_end(text)
+    return np.frombuffer(data, dtype=np.float32).reshape(1, EMBEDDING_DIM).copy()
+
+
+def _cache_query_vec(text: str, vec: np.ndarray) -> None:
+    # Stored as immutable bytes so callers can't mutate a cached vector
+    with _query_cache_lock:
+        _query_cache[text] = vec.tobytes()
+        _query_cache.move_to_end(text)
+        if len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+
+async def embed_query_batched(text: str) -> np.ndarray:
+    """
+    Embed a single query, shape (1, EMBEDDING_DIM), coalescing it with any
+    other queries that arrive within QUERY_BATCH_WINDOW_S into one forward
+    pass — batched encoding costs far less per query than batch=1 calls.
+    Repeated queries are answered from the shared LRU without queuing.
+    """
+    global _batch_queue, _batch_task
+    cached = _cached_query_vec(text)
+    if cached is not None:
+        return cached
+
+    if _batch_task is None or _batch_task.done():
+        _batch_queue = asyncio.Queue()
+        _batch_task = asyncio.create_task(_batch_worker(_batch_queue))
+
+    future = asyncio.get_running_loop().create_future()
+    _batch_queue.put_nowait((text, future))
+    return await future
+
+
+async def _batch_worker(queue: asyncio.Queue) -> None:
+    """Collect queued queries for one window, encode them together, resolve futures."""
+    while True:
+        batch = [await queue.get()]
+        await asyncio.sleep(QUERY_BATCH_WINDOW_S)
+        while len(batch) < QUERY_BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await asyncio.to_thread(_encode_queries, texts)
+        except Exception as e:
+            logger.error("Batched query embedding failed: %s", e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for i, (text, future) in enumerate(batch):
+            _cache_query_vec(text, vectors[i])
+            if not future.done():   # the caller may have been cancelled
+                future.set_result(vectors[i:i + 1].copy())
+
+
+def _encode_queries(texts: list[str]) -> np.ndarray:
+    model = _get_model()
+    vecs = model.encode(
+        texts,
+        batch_size=QUERY_BATCH_MAX,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return vecs.astype(np.float32, copy=False)
+
+
+async def close_query_batcher() -> None:
+    """Stop the query micro-batcher (called on app shutdown)."""
+    global _batch_queue, _batch_task
+    if _batch_task is not None:
+        _batch_task.cancel()
+        try:
+            await _batch_task
+        except asyncio.CancelledError:
+            pass
+    _batch_queue = None
+    _batch_task = None
+
+
 def build_index(chunks: list[dict]) -> faiss.Index:
     """
     Create a FAISS inner-product index from chunk texts.
     Also saves both the index and chunks metadata to disk.
+
+    The index type scales with the corpus (see _index_description): an
+    8-bit scalar-quantised flat index for small corpora, IVF partitioning
+    for sub-linear search as it grows.
     """
     texts = [c["text"] for c in chunks]
     logger.info("Embedding %d chunks...", len(texts))
-    embeddings = embed_texts(texts)
+    return build_index_from_embeddings(chunks, embed_texts(texts))
 
-    # Inner-product index (with normalised vectors, IP == cosine)
-    index = faiss.IndexFlatIP(EMBEDDING_DIM)
-    index.add(embeddings)
+
+def build_index_from_embeddings(chunks: list[dict], embeddings: np.ndarray) -> faiss.Index:
+    """
+    Create and persist the FAISS index from already-computed chunk vectors,
+    row-aligned with chunks (e.g. embedded incrementally at startup).
+    """
+    global _chunk_vectors
+    index = _make_index(embeddings)
+    _chunk_vectors = embeddings
 
     # Persist
-    save_index(index, chunks)
+    save_index(index, chunks, embeddings)
     logger.info("FAISS index built with %d vectors", index.ntotal)
     return index
 
 
-def save_index(index: faiss.Index, chunks: list[dict]) -> None:
-    """Save FAISS index and chunks metadata to disk."""
+def _index_description(n_vectors: int) -> str:
+    """faiss.index_factory spec for a corpus of n_vectors."""
+    # Small corpora are searched exactly in numpy (see retriever.search), so
+    # the index is only kept as a lossless copy of the vectors
+    if n_vectors < IVF_MIN_VECTORS:
+        return "Flat"
+    # SQ8 stores each dimension as one byte (384 B instead of 1.5 KB per
+    # vector); the scan is bandwidth-bound, so it also runs faster
+    if n_vectors < IVF_PQ_MIN_VECTORS:
+        return "IVF16,SQ8"
+    # Product quantisation: 16 bytes per vector
+    return "IVF64,PQ16"
+
+
+def _make_index(embeddings: np.ndarray) -> faiss.Index:
+    """Build a search-ready FAISS index over already-normalised vectors."""
+    # Inner-product index (with normalised vectors, IP == cosine)
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = faiss.index_factory(
+        EMBEDDING_DIM, _index_description(len(vectors)), faiss.METRIC_INNER_PRODUCT,
+    )
+    if not index.is_trained:
+        # IVF centroids (and PQ codebooks) are learned from the corpus itself
+        index.train(vectors)
+    index.add(vectors)
+    _configure_search(index)
+    return index
+
+
+def _configure_search(index: faiss.Index) -> None:
+    """Apply query-time search parameters to a freshly built or loaded index."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+        # Queries arrive one at a time, so the default (parallelise across
+        # queries) leaves all but one core idle. Mode 2 splits a single
+        # query's list scan across threads instead — better interactive
+        # latency at the cost of throughput for large batched searches.
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        ivf.parallel_mode = 2
+
+
+def save_index(
+    index: faiss.Index,
+    chunks: list[dict],
+    embeddings: np.ndarray | None = None,
+) -> None:
+    """
+    Save FAISS index and chunks metadata to disk, plus the raw chunk
+    vectors (as .npy) when given so they can be memory-mapped on load.
+    Chunks are written as MsgPack (fast to load) and JSON (for inspection).
+    """
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
     faiss.write_index(index, str(FAISS_INDEX_PATH))
-    with open(CHUNKS_PATH, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+    CHUNKS_MSGPACK_PATH.write_bytes(msgpack.packb(chunks, use_bin_type=True))
+    CHUNKS_PATH.write_bytes(orjson.dumps(chunks))
+    if embeddings is not None:
+        np.save(EMBEDDINGS_PATH, embeddings)
     logger.info("Index saved to %s", FAISS_INDEX_PATH)
 
 
 def load_index() -> tuple[faiss.Index | None, list[dict] | None]:
-    """Load FAISS index and chunks from disk. Returns (None, None) if missing."""
-    if not FAISS_INDEX_PATH.exists() or not CHUNKS_PATH.exists():
+    """
+    Load FAISS index and chunks from disk. Returns (None, None) if missing.
+
+    Chunk vectors are memory-mapped from the .npy file; if only the vectors
+    survive (no FAISS file), the index is rebuilt from them without re-encoding.
+    """
+    global _chunk_vectors
+    if not index_exists():
         return None, None
     try:
-        index = faiss.read_index(str(FAISS_INDEX_PATH))
-        with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-            chunks = json.load(f)
+        chunks = _load_chunks()
+        vectors = None
+        if EMBEDDINGS_PATH.exists():
+            vectors = np.load(EMBEDDINGS_PATH, mmap_mode="r")
+
+        if FAISS_INDEX_PATH.exists():
+            index = faiss.read_index(str(FAISS_INDEX_PATH))
+            _configure_search(index)
+        else:
+            logger.info("Rebuilding FAISS index from stored embeddings...")
+            index = _make_index(vectors)
+            faiss.write_index(index, str(FAISS_INDEX_PATH))
+
+        if vectors is None:
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is not None:
+                # IVF lists can only be reconstructed by id through a direct map
+                ivf.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal)
+        _chunk_vectors = vectors
         logger.info("Loaded existing index with %d vectors", index.ntotal)
         return index, chunks
     except Exception as e:
@@ -95,6 +371,32 @@ def load_index() -> tuple[faiss.Index | None, list[dict] | None]:
         return None, None
 
 
+def _load_chunks() -> list[dict]:
+    """Read chunk metadata, preferring MsgPack over the JSON copy."""
+    if CHUNKS_MSGPACK_PATH.exists():
+        return msgpack.unpackb(CHUNKS_MSGPACK_PATH.read_bytes(), raw=False)
+    return orjson.loads(CHUNKS_PATH.read_bytes())
+
+
+def get_chunk_vectors() -> np.ndarray | None:
+    """
+    Return all stored chunk vectors, shape (n_chunks, EMBEDDING_DIM),
+    row-aligned with the chunks list. None if no index has been built/loaded.
+    """
+    return _chunk_vectors
+
+
+def get_vectors_by_ids(ids: list[int]) -> np.ndarray | None:
+    """
+    Return the stored chunk vectors for the given chunk ids,
+    shape (len(ids), EMBEDDING_DIM). None if no index has been built/loaded.
+    """
+    if _chunk_vectors is None:
+        return None
+    return _chunk_vectors[ids]
+
+
 def index_exists() -> bool:
-    """Check whether a saved index already exists on disk."""
-    return FAISS_INDEX_PATH.exists() and CHUNKS_PATH.exists()
+    """Check whether a saved index (or the vectors to rebuild it) exists on disk."""
+    has_chunks = CHUNKS_MSGPACK_PATH.exists() or CHUNKS_PATH.exists()
+    return has_chunks and (FAISS_INDEX_PATH.exists() or EMBEDDINGS_PATH.exists())
@@ -4,31 +4,61 @@ Flags issues without blocking the response.
 """
 
 import re
-import numpy as np
-from app.embeddings import embed_texts
+from functools import lru_cache
+from app.chunk_store import ChunkStore
+from app.embeddings import embed_texts, embed_query, get_vectors_by_ids
 from app.config import GROUNDING_THRESHOLD
 import logging
 
 logger = logging.getLogger(__name__)
 
 # ── Refusal phrase patterns ──────────────────────────────────────────
-_REFUSAL_PATTERNS = re.compile(
-    r"(I don'?t have|not mentioned|cannot find|no information|"
-    r"I'?m unable|not available in the provided|I couldn'?t find|"
-    r"does not (contain|mention|provide|include)|"
-    r"no relevant (information|data|context)|"
-    r"beyond the scope|outside (of )?the (provided|available)|"
-    r"isn'?t covered|not covered|I don'?t know|"
-    r"unable to (find|locate|determine)|"
-    r"the (documents?|context) (does|do) not)",
-    re.IGNORECASE,
+# Plain lowercase phrases; callers lowercase the answer once. Optional
+# "'" and "of " variants are spelled out so a substring matcher can use them.
+_REFUSAL_PHRASES: tuple[str, ...] = (
+    "i don't have", "i dont have",
+    "not mentioned",
+    "cannot find",
+    "no information",
+    "i'm unable", "im unable",
+    "not available in the provided",
+    "i couldn't find", "i couldnt find",
+    "does not contain", "does not mention", "does not provide", "does not include",
+    "no relevant information", "no relevant data", "no relevant context",
+    "beyond the scope",
+    "outside the provided", "outside of the provided",
+    "outside the available", "outside of the available",
+    "isn't covered", "isnt covered", "not covered",
+    "i don't know", "i dont know",
+    "unable to find", "unable to locate", "unable to determine",
+    "the document does not", "the document do not",
+    "the documents does not", "the documents do not",
+    "the context does not", "the context do not",
 )
 
+# Single Aho-Corasick automaton over all phrases: one linear scan per answer.
+# Falls back to a regex alternation when pyahocorasick isn't installed.
+try:
+    import ahocorasick
+
+    _REFUSAL_AC = ahocorasick.Automaton()
+    for _phrase in _REFUSAL_PHRASES:
+        _REFUSAL_AC.add_word(_phrase, _phrase)
+    _REFUSAL_AC.make_automaton()
+except ImportError:
+    _REFUSAL_AC = None
+
+_REFUSAL_PATTERNS = re.compile("|".join(re.escape(p) for p in _REFUSAL_PHRASES))
+
+# Answers of this many characters or fewer are too brief to judge for context/grounding
+_MIN_ANSWER_CHARS = 20
+
 
 def evaluate(
     answer: str,
     retrieved_chunks: list[dict],
     chunks_retrieved_count: int,
+    store: ChunkStore,
 ) -> list[str]:
     """
     Run all evaluator checks on the LLM response.
@@ -37,63 +67,64 @@ def evaluate(
     """
     flags: list[str] = []
 
-    # ── Check 1: no_context ──────────────────────────────────────────
-    if _check_no_context(answer, chunks_retrieved_count):
-        flags.append("no_context")
+    # The checks are mutually exclusive and ordered cheapest-first, so the
+    # grounding embedding only runs for substantive, non-refusal answers.
 
-    # ── Check 2: refusal ─────────────────────────────────────────────
+    # ── Check 1: refusal ─────────────────────────────────────────────
     if _check_refusal(answer):
         flags.append("refusal")
 
+    # ── Check 2: no_context ──────────────────────────────────────────
+    elif _check_no_context(answer, chunks_retrieved_count):
+        flags.append("no_context")
+
     # ── Check 3: low_grounding (custom) ──────────────────────────────
-    if chunks_retrieved_count > 0 and not _check_refusal(answer):
-        if _check_low_grounding(answer, retrieved_chunks):
-            flags.append("low_grounding")
+    elif (
+        chunks_retrieved_count > 0
+        and len(answer.strip()) > _MIN_ANSWER_CHARS
+        and _check_low_grounding(answer, retrieved_chunks, store)
+    ):
+        flags.append("low_grounding")
 
     logger.info("Evaluator flags: %s", flags if flags else "none")
     return flags
 
 
 def _check_no_context(answer: str, chunks_count: int) -> bool:
-    """Flag if the LLM produced an answer but no chunks were retrieved."""
+    """Flag if the LLM produced a (non-refusal) answer but no chunks were retrieved."""
     if chunks_count > 0:
         return False
-    # If it's a refusal, that's a separate flag
-    if _REFUSAL_PATTERNS.search(answer):
-        return False
     # LLM answered without any context — suspicious
-    return len(answer.strip()) > 20
+    return len(answer.strip()) > _MIN_ANSWER_CHARS
 
 
 def _check_refusal(answer: str) -> bool:
     """Flag if the LLM explicitly refused to answer."""
-    return bool(_REFUSAL_PATTERNS.search(answer))
+    text = answer.lower()
+    if _REFUSAL_AC is not None:
+        return next(_REFUSAL_AC.iter(text), None) is not None
+    return bool(_REFUSAL_PATTERNS.search(text))
 
 
-def _check_low_grounding(answer: str, retrieved_chunks: list[dict]) -> bool:
+def _check_low_grounding(answer: str, retrieved_chunks: list[dict], store: ChunkStore) -> bool:
     """
-    Compare the LLM response embedding against the concatenated retrieved
-    chunk embeddings via cosine similarity. Low similarity → possible hallucination.
+    Compare the LLM response embedding against each retrieved chunk's vector
+    via cosine similarity; the best-matching chunk decides. Low similarity →
+    possible hallucination.
+
+    Uses the per-chunk vectors already stored alongside the FAISS index, so
+    only the answer needs a forward pass. Scoring chunks individually also
+    avoids the 512-token truncation a concatenated context would hit.
     """
     try:
-        # Build context text from chunks
-        context_texts = []
-        for item in retrieved_chunks:
-            chunk = item.get("chunk", item)
-            context_texts.append(chunk.get("text", ""))
-
-        if not context_texts:
+        if not retrieved_chunks:
             return False
 
-        combined_context = " ".join(context_texts)
+        chunk_ids = tuple(item["idx"] for item in retrieved_chunks)
+        similarity = _grounding_similarity(answer, chunk_ids)
 
-        # Embed both answer and context
-        embeddings = embed_texts([answer, combined_context])
-        answer_vec = embeddings[0]
-        context_vec = embeddings[1]
-
-        # Cosine similarity (vectors are already L2-normalised)
-        similarity = float(np.dot(answer_vec, context_vec))
+        if similarity is None:
+            similarity = _chunk_text_similarity(answer, [store.text[i] for i in chunk_ids])
 
         logger.info("Grounding cosine similarity: %.4f (threshold: %.2f)",
                     similarity, GROUNDING_THRESHOLD)
@@ -103,3 +134,20 @@ def _check_low_grounding(answer: str, retrieved_chunks: list[dict]) -> bool:
     except Exception as e:
         logger.error("Grounding check failed: %s", e)
         return False
+
+
+@lru_cache(maxsize=256)
+def _grounding_similarity(answer: str, chunk_ids: tuple[int, ...]) -> float | None:
+    """Max cosine similarity between the answer and the stored chunk vectors."""
+    ctx_vecs = get_vectors_by_ids(list(chunk_ids))   # shape (k, 384)
+    if ctx_vecs is None:
+        return None
+    answer_vec = embed_query(answer)[0]              # shape (384,)
+    # Vectors are already L2-normalised, so the dot product is the cosine
+    return float((ctx_vecs @ answer_vec).max())
+
+
+def _chunk_text_similarity(answer: str, context_texts: list[str]) -> float:
+    """Fallback without stored vectors: embed the answer and each chunk text."""
+    embeddings = embed_texts([answer, *context_texts])
+    return float((embeddings[1:] @ embeddings[0]).max())
@@ -3,46 +3,82 @@ LLM Client — Thin wrapper around the Groq Python SDK.
 No LangChain, no abstractions — just pure API calls.
 
 Supports multi-turn conversation via the messages[] array:
-  system prompt → conversation history → current user message
+  system prompt → conversation history → retrieved context → current user message
 
-Supports both batch and streaming modes.
+Supports both batch and streaming modes. Streaming talks to the
+OpenAI-compatible endpoint directly over httpx and parses the SSE lines
+itself, skipping the SDK's per-chunk model validation.
 """
 
-from groq import Groq
-from app.config import GROQ_API_KEY
+import httpx
+import orjson
+from groq import AsyncGroq
+from app.config import GROQ_API_KEY, GROQ_CHAT_COMPLETIONS_URL
 import logging
 
 logger = logging.getLogger(__name__)
 
-_client: Groq | None = None
+_http: httpx.AsyncClient | None = None
+_client: AsyncGroq | None = None
 
 
-def _get_client() -> Groq:
-    """Lazy-initialise the Groq client."""
+def _get_http() -> httpx.AsyncClient:
+    """
+    Lazy-initialise the shared HTTP/2 connection pool. Both the SDK client
+    and the raw streaming path go through it, so every completion reuses
+    warm keep-alive connections instead of paying TCP/TLS setup per call.
+    """
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            http2=True,
+            timeout=60,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _http
+
+
+def _get_client() -> AsyncGroq:
+    """Lazy-initialise the async Groq client on the shared connection pool."""
     global _client
     if _client is None:
         if not GROQ_API_KEY:
             raise ValueError(
                 "GROQ_API_KEY is not set. Add it to your .env file."
             )
-        _client = Groq(api_key=GROQ_API_KEY)
+        _client = AsyncGroq(api_key=GROQ_API_KEY, http_client=_get_http())
     return _client
 
 
-def _build_messages(system_prompt, user_message, conversation_history=None):
-    """Build the messages array for the API call."""
+async def close_client() -> None:
+    """Close the shared connection pool (called on app shutdown)."""
+    global _http, _client
+    if _http is not None:
+        await _http.aclose()
+    _http = None
+    _client = None
+
+
+def _build_messages(system_prompt, user_message, conversation_history=None, context_prompt=None):
+    """
+    Build the messages array for the API call. The per-turn context goes
+    after the history so everything before it is a stable, cacheable prefix.
+    """
     messages = [{"role": "system", "content": system_prompt}]
     if conversation_history:
         messages.extend(conversation_history)
+    if context_prompt:
+        messages.append({"role": "system", "content": context_prompt})
     messages.append({"role": "user", "content": user_message})
     return messages
 
 
-def generate(
+async def generate(
     model: str,
     system_prompt: str,
     user_message: str,
     conversation_history: list[dict] | None = None,
+    context_prompt: str | None = None,
     temperature: float = 0.3,
     max_tokens: int = 1024,
 ) -> dict:
@@ -57,10 +93,12 @@ def generate(
     }
     """
     client = _get_client()
-    messages = _build_messages(system_prompt, user_message, conversation_history)
+    messages = _build_messages(
+        system_prompt, user_message, conversation_history, context_prompt,
+    )
 
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
@@ -81,11 +119,12 @@ def generate(
         raise
 
 
-def generate_stream(
+async def generate_stream(
     model: str,
     system_prompt: str,
     user_message: str,
     conversation_history: list[dict] | None = None,
+    context_prompt: str | None = None,
     temperature: float = 0.3,
     max_tokens: int = 1024,
 ):
@@ -102,32 +141,53 @@ def generate_stream(
     2. Token usage is only available in the final stream chunk
     3. A complete JSON response can't be built until all tokens are collected
     """
-    client = _get_client()
-    messages = _build_messages(system_prompt, user_message, conversation_history)
-
-    try:
-        stream = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=True,
+    if not GROQ_API_KEY:
+        raise ValueError(
+            "GROQ_API_KEY is not set. Add it to your .env file."
         )
+    messages = _build_messages(
+        system_prompt, user_message, conversation_history, context_prompt,
+    )
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
 
+    try:
         input_tokens = 0
         output_tokens = 0
 
-        for chunk in stream:
-            # Extract token content from the delta
-            delta = chunk.choices[0].delta if chunk.choices else None
-            if delta and delta.content:
-                yield {"type": "token", "content": delta.content}
-
-            # Groq provides usage in the final chunk via x_groq
-            if hasattr(chunk, 'x_groq') and chunk.x_groq and hasattr(chunk.x_groq, 'usage'):
-                usage = chunk.x_groq.usage
-                input_tokens = usage.prompt_tokens if usage else 0
-                output_tokens = usage.completion_tokens if usage else 0
+        async with _get_http().stream(
+            "POST", GROQ_CHAT_COMPLETIONS_URL, headers=headers, json=payload,
+        ) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                raise RuntimeError(f"HTTP {response.status_code}: {body}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                chunk = orjson.loads(data)
+
+                # Extract token content from the delta
+                choices = chunk.get("choices")
+                if choices:
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield {"type": "token", "content": content}
+
+                # Groq provides usage in the final chunk via x_groq
+                usage = (chunk.get("x_groq") or {}).get("usage")
+                if usage:
+                    input_tokens = usage.get("prompt_tokens", 0)
+                    output_tokens = usage.get("completion_tokens", 0)
 
         yield {
             "type": "done",
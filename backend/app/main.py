@@ -2,28 +2,42 @@
 ClearPath Chatbot — FastAPI Application
 """
 
+import asyncio
 import time
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+import anyio
+import faiss
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
-import json
+import msgspec
+from typing import Annotated, Optional
 import os
+import numpy as np
+import orjson
 from pathlib import Path
 
-from app.config import INDEX_DIR
-from app.pdf_parser import parse_all_pdfs
+from app.config import INDEX_DIR, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+from app.pdf_parser import find_pdfs, parse_pdf
 from app.chunker import chunk_blocks
-from app.embeddings import build_index, load_index, index_exists
-from app.retriever import retrieve
+from app.embeddings import (
+    build_index_from_embeddings,
+    embed_texts,
+    load_index,
+    index_exists,
+    embed_query_batched,
+    close_query_batcher,
+)
+from app.retriever import search
+from app.cache import SemanticCache
+from app.chunk_store import ChunkStore
 from app.router import classify_query, maybe_upgrade_after_retrieval
-from app.llm_client import generate, generate_stream
-from app.prompts import build_prompt
+from app.llm_client import generate, generate_stream, close_client
+from app.prompts import SYSTEM_PROMPT, build_prompt
 from app.evaluator import evaluate
 from app.conversation import (
     get_or_create_id, add_message, get_messages_for_llm,
@@ -39,7 +53,10 @@ logger = logging.getLogger("clearpath")
 
 # ── Global state (populated on startup) ───────────────────────────────
 faiss_index = None
-chunks_store: list[dict] = []
+chunks_store = ChunkStore()
+
+# First-turn answers keyed by question embedding, reused for near-duplicates
+_response_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
 
 
 # ── Startup / Shutdown ────────────────────────────────────────────────
@@ -48,23 +65,86 @@ async def lifespan(app: FastAPI):
     """Build or load the FAISS index on startup."""
     global faiss_index, chunks_store
 
+    faiss_index, chunks_store = await _load_or_build_index()
+
+    yield  # App runs here
+
+    logger.info("Shutting down ClearPath Chatbot.")
+    await close_client()
+    await close_query_batcher()
+
+
+async def _load_or_build_index() -> tuple[faiss.Index | None, ChunkStore]:
+    """
+    Load the index from disk, or build it from the PDFs. Only the columnar
+    store is returned; the chunk dicts are dropped once it has been built.
+    """
     if index_exists():
         logger.info("Loading existing index from disk...")
-        faiss_index, chunks_store = load_index()
+        index, chunks = load_index()
     else:
         logger.info("No existing index found — building from PDFs...")
         INDEX_DIR.mkdir(parents=True, exist_ok=True)
-        raw_blocks = parse_all_pdfs()
-        if not raw_blocks:
+        index, chunks = await _build_index_pipelined()
+        if not chunks:
             logger.error("No content extracted from PDFs!")
         else:
-            chunks_store = chunk_blocks(raw_blocks)
-            faiss_index = build_index(chunks_store)
-            logger.info("Index ready: %d chunks indexed", len(chunks_store))
+            logger.info("Index ready: %d chunks indexed", len(chunks))
 
-    yield  # App runs here
+    return index, ChunkStore.from_dicts(chunks or [])
 
-    logger.info("Shutting down ClearPath Chatbot.")
+
+async def _build_index_pipelined() -> tuple[faiss.Index | None, list[dict]]:
+    """
+    Build the index with parsing, chunking and embedding running as a
+    pipeline, one PDF at a time: later files are parsed (in worker
+    processes) and chunked while earlier ones are being embedded, so startup
+    takes roughly as long as the slowest stage rather than the sum of all.
+    """
+    pdf_files = find_pdfs()
+    if not pdf_files:
+        return None, []
+
+    loop = asyncio.get_running_loop()
+    blocks_q: asyncio.Queue = asyncio.Queue()   # per-file blocks; None ends the stream
+    chunks_q: asyncio.Queue = asyncio.Queue()   # per-file chunks; None ends the stream
+    chunks: list[dict] = []
+    vectors: list[np.ndarray] = []
+
+    async def parse_stage(executor: ProcessPoolExecutor) -> None:
+        # Submit every file up front; awaiting in order keeps chunk ids stable
+        futures = [loop.run_in_executor(executor, parse_pdf, path) for path in pdf_files]
+        for future in futures:
+            await blocks_q.put(await future)
+        await blocks_q.put(None)
+
+    async def chunk_stage() -> None:
+        while (file_blocks := await blocks_q.get()) is not None:
+            if file_blocks:
+                await chunks_q.put(chunk_blocks(file_blocks))
+        await chunks_q.put(None)
+
+    async def embed_stage() -> None:
+        while (file_chunks := await chunks_q.get()) is not None:
+            texts = [c["text"] for c in file_chunks]
+            vectors.append(await asyncio.to_thread(embed_texts, texts))
+            chunks.extend(file_chunks)
+
+    workers = min(os.cpu_count() or 1, len(pdf_files))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(parse_stage, executor)
+            tg.start_soon(chunk_stage)
+            tg.start_soon(embed_stage)
+
+    if not chunks:
+        return None, []
+
+    # IVF tiers need every vector to train, so the index is built once at the end
+    index = await asyncio.to_thread(
+        build_index_from_embeddings, chunks, np.concatenate(vectors),
+    )
+    return index, chunks
 
 
 # ── App ───────────────────────────────────────────────────────────────
@@ -93,25 +173,21 @@ if STATIC_DIR.exists():
         app.mount("/assets", StaticFiles(directory=str(assets_dir)), name="assets")
 
 
-# ── Pydantic Models ──────────────────────────────────────────────────
-class QueryRequest(BaseModel):
-    question: str = Field(..., min_length=1, description="The user's query")
-    conversation_id: Optional[str] = Field(
-        None, description="Optional conversation ID for multi-turn"
-    )
-    session_id: Optional[str] = Field(
-        None, description="Optional session ID for isolation"
-    )
+# ── Request / Response Models ────────────────────────────────────────
+# msgspec Structs: requests are decoded and validated, and responses
+# encoded, in C — no per-request pydantic model tree.
+class QueryRequest(msgspec.Struct):
+    question: Annotated[str, msgspec.Meta(min_length=1, description="The user's query")]
+    conversation_id: Optional[str] = None   # optional conversation ID for multi-turn
+    session_id: Optional[str] = None        # optional session ID for isolation
 
 
-class TokenUsage(BaseModel):
+class TokenUsage(msgspec.Struct):
     input: int
     output: int
 
 
-class Metadata(BaseModel):
-    model_config = ConfigDict(protected_namespaces=())
-
+class Metadata(msgspec.Struct):
     model_used: str
     classification: str
     tokens: TokenUsage
@@ -120,83 +196,141 @@ class Metadata(BaseModel):
     evaluator_flags: list[str]
 
 
-class Source(BaseModel):
+class Source(msgspec.Struct):
     document: str
     page: int
     relevance_score: float
 
 
-class QueryResponse(BaseModel):
+class QueryResponse(msgspec.Struct):
     answer: str
     metadata: Metadata
     sources: list[Source]
     conversation_id: str
 
 
-# ── Main Query Endpoint ──────────────────────────────────────────────
-@app.post("/query", response_model=QueryResponse)
-async def query_endpoint(request: QueryRequest):
-    """Main RAG query endpoint with multi-turn conversation support."""
-    start_time = time.time()
+_query_decoder = msgspec.json.Decoder(QueryRequest)
+
+# Request body schema for the OpenAPI docs (FastAPI can't introspect Structs)
+_, _schemas = msgspec.json.schema_components([QueryRequest])
+_QUERY_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _schemas["QueryRequest"]}},
+    },
+}
 
+
+async def _decode_query(http_request: Request) -> QueryRequest:
+    """Decode and validate a QueryRequest body, 422 on invalid input."""
     try:
-        # 0. Conversation ID
-        conv_id = get_or_create_id(request.conversation_id, session_id=request.session_id)
+        return _query_decoder.decode(await http_request.body())
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-        # 1. Retrieve relevant chunks
-        if faiss_index is None or not chunks_store:
-            retrieved = []
-        else:
-            retrieved = retrieve(request.question, faiss_index, chunks_store)
 
-        # 2. Initial routing classification
-        route_result = classify_query(request.question)
+# ── Pre-generation stages ────────────────────────────────────────────
+async def _retrieve(question: str) -> tuple[np.ndarray | None, list[dict]]:
+    """
+    Embed the question and retrieve relevant chunks.
+    Returns (query_vec, chunks), or (None, []) if no index is loaded.
+    """
+    if faiss_index is None or not chunks_store:
+        return None, []
+    query_vec = await embed_query_batched(question)
+    retrieved = await asyncio.to_thread(search, query_vec, faiss_index, chunks_store)
+    return query_vec, retrieved
 
-        # 3. Post-retrieval upgrade check
-        route_result = maybe_upgrade_after_retrieval(route_result, retrieved)
 
-        # 4. Build the system prompt (context only, no history)
-        system_prompt = build_prompt(retrieved)
+async def _prepare(
+    question: str, conv_id: str,
+) -> tuple[tuple[np.ndarray | None, list[dict]], dict, list[dict]]:
+    """
+    Run retrieval, routing classification and history fetch concurrently.
+    Blocking work runs in worker threads to keep the event loop free for
+    other requests; retrieval batches its query embedding with theirs.
+    """
+    return await asyncio.gather(
+        _retrieve(question),
+        asyncio.to_thread(classify_query, question),
+        asyncio.to_thread(get_messages_for_llm, conv_id),
+    )
 
-        # 5. Get conversation history for multi-turn
-        conversation_history = get_messages_for_llm(conv_id)
 
-        # 6. Generate LLM response with multi-turn context
-        llm_result = generate(
-            model=route_result["model"],
-            system_prompt=system_prompt,
-            user_message=request.question,
-            conversation_history=conversation_history,
-        )
+def _build_sources(retrieved: list[dict], store: ChunkStore) -> list[dict]:
+    """One source entry per (document, page), keeping its best-ranked score."""
+    best: dict[tuple[int, int], float] = {}
+    for item in retrieved:
+        i = item["idx"]
+        key = (int(store.source_file_id[i]), int(store.page_number[i]))
+        best.setdefault(key, round(item["score"], 4))
+    return [
+        {"document": store.filenames[file_id], "page": page, "relevance_score": score}
+        for (file_id, page), score in best.items()
+    ]
 
-        # 7. Run evaluator
-        evaluator_flags = evaluate(
-            answer=llm_result["answer"],
-            retrieved_chunks=retrieved,
-            chunks_retrieved_count=len(retrieved),
+
+# ── Main Query Endpoint ──────────────────────────────────────────────
+@app.post("/query", openapi_extra=_QUERY_REQUEST_OPENAPI)
+async def query_endpoint(http_request: Request):
+    """Main RAG query endpoint with multi-turn conversation support."""
+    start_time = time.time()
+    request = await _decode_query(http_request)
+
+    try:
+        # 0. Conversation ID
+        conv_id = get_or_create_id(request.conversation_id, session_id=request.session_id)
+
+        # 1. Retrieve relevant chunks, classify the query and fetch
+        #    conversation history (concurrently)
+        (query_vec, retrieved), route_result, conversation_history = await _prepare(
+            request.question, conv_id,
         )
 
-        # 8. Build sources list
-        sources = []
-        sources_dicts = []  # for storage
-        seen = set()
-        for item in retrieved:
-            chunk = item["chunk"]
-            doc = chunk["source_file"]
-            page = chunk["page_number"]
-            key = (doc, page)
-            if key not in seen:
-                seen.add(key)
-                sources.append(Source(
-                    document=doc,
-                    page=page,
-                    relevance_score=round(item["score"], 4),
-                ))
-                sources_dicts.append({
-                    "document": doc,
-                    "page": page,
-                    "relevance_score": round(item["score"], 4),
-                })
+        # 2. Post-retrieval upgrade check
+        route_result = maybe_upgrade_after_retrieval(route_result, retrieved, chunks_store)
+
+        # 3. A fresh conversation can reuse the answer to a near-identical
+        #    earlier question (follow-ups depend on history, so never cached)
+        cacheable = query_vec is not None and not conversation_history
+        cached = _response_cache.get(query_vec) if cacheable else None
+
+        if cached is not None:
+            logger.info("Response cache hit for query: %r", request.question[:60])
+            route_result = cached["route"]
+            llm_result = {"answer": cached["answer"], "input_tokens": 0, "output_tokens": 0}
+            evaluator_flags = []
+        else:
+            # 4. Build the context message (retrieved chunks only, no history)
+            context_prompt = build_prompt(retrieved, chunks_store)
+
+            # 5. Generate LLM response with multi-turn context
+            llm_result = await generate(
+                model=route_result["model"],
+                system_prompt=SYSTEM_PROMPT,
+                context_prompt=context_prompt,
+                user_message=request.question,
+                conversation_history=conversation_history,
+            )
+
+            # 6. Run evaluator (embedding work, off the event loop)
+            evaluator_flags = await asyncio.to_thread(
+                evaluate,
+                answer=llm_result["answer"],
+                retrieved_chunks=retrieved,
+                chunks_retrieved_count=len(retrieved),
+                store=chunks_store,
+            )
+
+            # Only clean answers are worth replaying
+            if cacheable and not evaluator_flags:
+                _response_cache.put(
+                    query_vec, {"answer": llm_result["answer"], "route": route_result},
+                )
+
+        # 7. Build sources list
+        sources_dicts = _build_sources(retrieved, chunks_store)  # for storage
+        sources = [Source(**sd) for sd in sources_dicts]
 
         latency_ms = int((time.time() - start_time) * 1000)
 
@@ -212,7 +346,7 @@ async def query_endpoint(request: QueryRequest):
             "evaluator_flags": evaluator_flags,
         }
 
-        # 9. Update conversation memory (store with sources/metadata)
+        # 8. Update conversation memory (store with sources/metadata)
         add_message(conv_id, "user", request.question, session_id=request.session_id)
         add_message(
             conv_id, "assistant", llm_result["answer"],
@@ -221,12 +355,13 @@ async def query_endpoint(request: QueryRequest):
             session_id=request.session_id,
         )
 
-        return QueryResponse(
+        response = QueryResponse(
             answer=llm_result["answer"],
-            metadata=Metadata(**metadata_dict),
+            metadata=msgspec.convert(metadata_dict, Metadata),
             sources=sources,
             conversation_id=conv_id,
         )
+        return Response(msgspec.json.encode(response), media_type="application/json")
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -238,8 +373,8 @@ async def query_endpoint(request: QueryRequest):
         )
 
 # ── Streaming Endpoint ───────────────────────────────────────────────
-@app.post("/query/stream")
-async def query_stream_endpoint(request: QueryRequest):
+@app.post("/query/stream", openapi_extra=_QUERY_REQUEST_OPENAPI)
+async def query_stream_endpoint(http_request: Request):
     """
     SSE streaming endpoint — tokens arrive in real-time.
 
@@ -251,66 +386,54 @@ async def query_stream_endpoint(request: QueryRequest):
     Solution: stream raw tokens, then send structured metadata in a final event.
     """
     start_time = time.time()
+    request = await _decode_query(http_request)
 
     # Pre-stream work: retrieval, routing, prompt building
     conv_id = get_or_create_id(request.conversation_id, session_id=request.session_id)
 
-    if faiss_index is None or not chunks_store:
-        retrieved = []
-    else:
-        retrieved = retrieve(request.question, faiss_index, chunks_store)
-
-    route_result = classify_query(request.question)
-    route_result = maybe_upgrade_after_retrieval(route_result, retrieved)
-    system_prompt = build_prompt(retrieved)
-    conversation_history = get_messages_for_llm(conv_id)
+    (_, retrieved), route_result, conversation_history = await _prepare(
+        request.question, conv_id,
+    )
+    route_result = maybe_upgrade_after_retrieval(route_result, retrieved, chunks_store)
+    context_prompt = build_prompt(retrieved, chunks_store)
 
     # Build sources list (available before streaming)
-    sources_dicts = []
-    seen = set()
-    for item in retrieved:
-        chunk = item["chunk"]
-        doc = chunk["source_file"]
-        page = chunk["page_number"]
-        key = (doc, page)
-        if key not in seen:
-            seen.add(key)
-            sources_dicts.append({
-                "document": doc,
-                "page": page,
-                "relevance_score": round(item["score"], 4),
-            })
-
-    def sse_generator():
+    sources_dicts = _build_sources(retrieved, chunks_store)
+
+    async def sse_generator():
         full_answer = []
         input_tokens = 0
         output_tokens = 0
 
         # Stream tokens from LLM
-        for event in generate_stream(
+        async for event in generate_stream(
             model=route_result["model"],
-            system_prompt=system_prompt,
+            system_prompt=SYSTEM_PROMPT,
+            context_prompt=context_prompt,
             user_message=request.question,
             conversation_history=conversation_history,
         ):
             if event["type"] == "token":
                 full_answer.append(event["content"])
-                yield f"data: {json.dumps(event)}\n\n"
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
 
             elif event["type"] == "done":
                 input_tokens = event["input_tokens"]
                 output_tokens = event["output_tokens"]
 
             elif event["type"] == "error":
-                yield f"data: {json.dumps(event)}\n\n"
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
                 return
 
-        # Post-stream: evaluator runs on the COMPLETE answer
+        # Post-stream: evaluator runs on the COMPLETE answer (embedding
+        # work, off the event loop so other streams keep flowing)
         answer_text = "".join(full_answer)
-        evaluator_flags = evaluate(
+        evaluator_flags = await asyncio.to_thread(
+            evaluate,
             answer=answer_text,
             retrieved_chunks=retrieved,
             chunks_retrieved_count=len(retrieved),
+            store=chunks_store,
         )
 
         latency_ms = int((time.time() - start_time) * 1000)
@@ -340,7 +463,7 @@ async def query_stream_endpoint(request: QueryRequest):
             "sources": sources_dicts,
             "conversation_id": conv_id,
         }
-        yield f"data: {json.dumps(done_event)}\n\n"
+        yield b"data: " + orjson.dumps(done_event) + b"\n\n"
 
     return StreamingResponse(
         sse_generator(),
@@ -3,8 +3,11 @@ PDF Parser — Extracts text page-by-page from all PDFs in clearpath_docs/
 with metadata: source_file, page_number, section_heading.
 """
 
+import os
 import re
-import pdfplumber
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import pymupdf
 from pathlib import Path
 from app.config import DOCS_DIR
 import logging
@@ -12,20 +15,27 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Heuristic: a line is likely a heading if it's short, ends without period,
-# and is either all-caps or title-case.
-_HEADING_RE = re.compile(
-    r"^(?:[A-Z][A-Za-z0-9 &/\-:–—]{2,80}|[A-Z][A-Z0-9 &/\-:–—]{2,80})$"
-)
+# and is either all-caps or title-case. (The all-caps form is a subset of
+# this character class, so one pattern covers both.)
+_HEADING_RE = re.compile(r"[A-Z][A-Za-z0-9 &/\-:–—]{2,80}")
+
+# A line holding only whitespace: separates paragraphs when present
+_BLANK_LINE_RE = re.compile(r"\n\s*\n")
 
 
 def _detect_heading(line: str) -> bool:
     """Return True if *line* looks like a section heading."""
-    stripped = line.strip()
+    return _is_heading(line.strip())
+
+
+@lru_cache(maxsize=8192)
+def _is_heading(stripped: str) -> bool:
+    # Cached on the trimmed line: page headers/footers repeat on every page
     if not stripped or len(stripped) > 100:
         return False
     if stripped.endswith((".","!","?")):
         return False
-    if _HEADING_RE.match(stripped):
+    if _HEADING_RE.fullmatch(stripped):
         return True
     # Also treat lines that are title-case and short as headings
     if stripped.istitle() and len(stripped.split()) <= 10:
@@ -48,46 +58,64 @@ def parse_all_pdfs() -> list[dict]:
     """
     all_blocks: list[dict] = []
 
-    pdf_files = sorted(DOCS_DIR.glob("*.pdf"))
+    pdf_files = find_pdfs()
     if not pdf_files:
-        logger.warning("No PDF files found in %s", DOCS_DIR)
         return all_blocks
 
-    for pdf_path in pdf_files:
-        logger.info("Parsing: %s", pdf_path.name)
-        try:
-            file_blocks = _parse_single_pdf(pdf_path)
+    # PyMuPDF text extraction is CPU-bound, so files are parsed in separate processes;
+    # map() keeps the results in sorted file order
+    workers = min(os.cpu_count() or 1, len(pdf_files))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_blocks in executor.map(parse_pdf, pdf_files):
             all_blocks.extend(file_blocks)
-        except Exception as e:
-            logger.error("Failed to parse %s: %s", pdf_path.name, e)
 
     logger.info("Total blocks extracted: %d from %d PDFs", len(all_blocks), len(pdf_files))
     return all_blocks
 
 
+def find_pdfs() -> list[Path]:
+    """Return the PDFs in DOCS_DIR, sorted by filename."""
+    pdf_files = sorted(DOCS_DIR.glob("*.pdf"))
+    if not pdf_files:
+        logger.warning("No PDF files found in %s", DOCS_DIR)
+    return pdf_files
+
+
+def parse_pdf(pdf_path: Path) -> list[dict]:
+    """
+    Parse one PDF into blocks (same format as parse_all_pdfs).
+    Logs and returns an empty list on failure. Module-level so it can be
+    sent to worker processes.
+    """
+    logger.info("Parsing: %s", pdf_path.name)
+    try:
+        return _parse_single_pdf(pdf_path)
+    except Exception as e:
+        logger.error("Failed to parse %s: %s", pdf_path.name, e)
+        return []
+
+
 def _parse_single_pdf(pdf_path: Path) -> list[dict]:
     """Extract text from a single PDF file, page by page."""
     blocks: list[dict] = []
     chunk_index = 0
 
-    with pdfplumber.open(pdf_path) as pdf:
+    with pymupdf.open(pdf_path) as doc:
         current_heading = ""
 
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
+        for page_num, page in enumerate(doc, start=1):
+            text = page.get_text("text")
             if not text or not text.strip():
                 continue
 
             # Split page into paragraphs (double newline or heading transitions)
-            paragraphs = _split_into_paragraphs(text)
-
-            for para in paragraphs:
+            for para in _iter_paragraphs(text):
                 para_stripped = para.strip()
                 if not para_stripped:
                     continue
 
                 # Check if the first line is a heading
-                first_line = para_stripped.split("\n")[0].strip()
+                first_line = para_stripped.partition("\n")[0].strip()
                 if _detect_heading(first_line):
                     current_heading = first_line
 
@@ -103,30 +131,24 @@ def _parse_single_pdf(pdf_path: Path) -> list[dict]:
     return blocks
 
 
-def _split_into_paragraphs(text: str) -> list[str]:
+def _iter_paragraphs(text: str):
     """
-    Split extracted page text into paragraphs.
-    Uses double newlines as primary separator, falls back to single
-    newlines when paragraphs seem to end with sentence-terminal punctuation.
+    Yield the paragraphs of extracted page text.
+    Uses blank lines as the separator when the page has any; otherwise
+    splits on single newlines after sentence-terminal punctuation or a
+    heading, emitting each paragraph as soon as it closes.
     """
-    # First try double newlines
-    parts = re.split(r"\n\s*\n", text)
-    if len(parts) > 1:
-        return parts
-
-    # Fallback: split on single newlines that follow sentence-end punctuation
-    lines = text.split("\n")
-    paragraphs: list[str] = []
-    current: list[str] = []
+    if _BLANK_LINE_RE.search(text):
+        yield from _BLANK_LINE_RE.split(text)
+        return
 
-    for line in lines:
+    current: list[str] = []
+    for line in text.split("\n"):
         current.append(line)
         stripped = line.strip()
-        if stripped and (stripped.endswith((".", "!", "?", ":")) or _detect_heading(stripped)):
-            paragraphs.append("\n".join(current))
+        if stripped and (stripped.endswith((".", "!", "?", ":")) or _is_heading(stripped)):
+            yield "\n".join(current)
             current = []
 
     if current:
-        paragraphs.append("\n".join(current))
-
-    return paragraphs
+        yield "\n".join(current)
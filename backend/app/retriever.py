@@ -4,45 +4,75 @@ Retriever — Query the FAISS index and return top-K relevant chunks.
 
 import faiss
 import numpy as np
-from app.embeddings import embed_query
-from app.config import TOP_K
+from app.embeddings import get_chunk_vectors
+from app.cache import SemanticCache
+from app.chunk_store import ChunkStore
+from app.config import (
+    TOP_K,
+    IVF_MIN_VECTORS,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Near-duplicate queries reuse the previous top-K instead of searching again
+_retrieval_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
 
-def retrieve(
-    query: str,
+
+def search(
+    query_vec: np.ndarray,
     index: faiss.Index,
-    chunks: list[dict],
+    chunks: ChunkStore,
     top_k: int = TOP_K,
 ) -> list[dict]:
     """
-    Embed the user query and search the FAISS index.
+    Search the FAISS index with an already-embedded query.
 
     Returns a list of dicts, each containing:
     {
-        "chunk": { ...original chunk metadata... },
-        "score": float  # cosine similarity
+        "idx": int,       # row in the FAISS index / ChunkStore
+        "score": float    # cosine similarity
     }
-    Sorted by score descending.
+    Sorted by score descending. Chunk metadata is looked up in the store by idx.
     """
-    if index is None or not chunks:
-        logger.warning("Retriever called with empty index or chunks")
-        return []
+    cached = _retrieval_cache.get(query_vec)
+    if cached is not None and cached[0] == top_k:
+        logger.info("Retrieval cache hit (%d chunks)", len(cached[1]))
+        return list(cached[1])
 
-    query_vec = embed_query(query)                      # shape (1, 384)
-    scores, indices = index.search(query_vec, top_k)    # both shape (1, top_k)
+    # Small corpora are scanned exactly; the FAISS index is only built as
+    # IVF (and so only searched) from IVF_MIN_VECTORS up
+    vectors = get_chunk_vectors()
+    if vectors is not None and 0 < len(vectors) < IVF_MIN_VECTORS:
+        scores, indices = _exact_search(vectors, query_vec, top_k)
+    else:
+        scores, indices = index.search(query_vec, top_k)    # both shape (1, top_k)
 
     results: list[dict] = []
     for score, idx in zip(scores[0], indices[0]):
         if idx < 0 or idx >= len(chunks):
             continue
-        results.append({
-            "chunk": chunks[idx],
-            "score": float(score),
-        })
+        results.append({"idx": int(idx), "score": float(score)})
 
     logger.info("Retrieved %d chunks for query (top score: %.3f)",
                 len(results), results[0]["score"] if results else 0.0)
-    return results
+    _retrieval_cache.put(query_vec, (top_k, results))
+    return list(results)
+
+
+def _exact_search(
+    vectors: np.ndarray,
+    query_vec: np.ndarray,
+    top_k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact inner-product top-K over the stored (already normalised) vectors
+    with a single BLAS matrix-vector product. Same shapes as index.search.
+    """
+    sims = vectors @ query_vec[0]                       # shape (n,)
+    k = min(top_k, len(sims))
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.argsort(-sims[top])]
+    return sims[top][None, :], top[None, :]
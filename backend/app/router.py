@@ -4,7 +4,11 @@ Classifies each query as 'simple' or 'complex' using additive signal scoring.
 """
 
 import re
+import threading
+from functools import lru_cache
+from app.chunk_store import ChunkStore
 from app.config import (
+    CLASSIFY_CACHE_SIZE,
     COMPLEXITY_THRESHOLD,
     MULTI_DOC_THRESHOLD,
     SIMPLE_MODEL,
@@ -15,33 +19,72 @@ import logging
 logger = logging.getLogger(__name__)
 
 # ── Keywords & Patterns ──────────────────────────────────────────────
-_COMPLEX_KEYWORDS = re.compile(
-    r"\b(compare|comparison|explain|difference|differences|why|how does|how do|"
-    r"analyze|analyse|pros and cons|trade-?off|versus|implications|impact|"
-    r"advantages|disadvantages|recommend|suggest|evaluate|assessment|"
-    r"relationship between|what happens if|describe in detail)\b",
-    re.IGNORECASE,
-)
+# Signal ids, shared by the Hyperscan database and the regex fallback
+_COMPLEX_KW, _COMPARISON, _NEGATION, _SUBCLAUSE, _MULTI_ENTITY = range(5)
+
+_SIGNAL_PATTERNS: dict[int, str] = {
+    _COMPLEX_KW: (
+        r"\b(compare|comparison|explain|difference|differences|why|how does|how do|"
+        r"analyze|analyse|pros and cons|trade-?off|versus|implications|impact|"
+        r"advantages|disadvantages|recommend|suggest|evaluate|assessment|"
+        r"relationship between|what happens if|describe in detail)\b"
+    ),
+    _COMPARISON: r"\b(vs\.?|versus|better|worse|or|compared to|differ)\b",
+    _NEGATION: r"\b(not|don't|doesn't|can't|cannot|won't|shouldn't|isn't|aren't)\b",
+    _SUBCLAUSE: (
+        r"(;|—|--|however|but\b|although|whereas|nevertheless|furthermore|moreover|"
+        r"on the other hand)"
+    ),
+    _MULTI_ENTITY: r"\b(and|both|all|each|every|multiple|several)\b",
+}
+
+# All patterns compiled into one Hyperscan database: a single DFA pass over
+# the query reports every signal id that fires. Falls back to one Python
+# regex per signal when hyperscan isn't installed.
+try:
+    import hyperscan
+
+    _HS_DB = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    _HS_DB.compile(
+        expressions=[p.encode() for p in _SIGNAL_PATTERNS.values()],
+        ids=list(_SIGNAL_PATTERNS),
+        elements=len(_SIGNAL_PATTERNS),
+        flags=[
+            hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+        ] * len(_SIGNAL_PATTERNS),
+    )
+    _HS_SCRATCH = hyperscan.Scratch(_HS_DB)
+except ImportError:
+    _HS_DB = None
 
-_COMPARISON_WORDS = re.compile(
-    r"\b(vs\.?|versus|better|worse|or|compared to|differ)\b",
-    re.IGNORECASE,
-)
+_SIGNAL_REGEXES = {
+    signal_id: re.compile(pattern, re.IGNORECASE)
+    for signal_id, pattern in _SIGNAL_PATTERNS.items()
+}
 
-_NEGATION_QUESTION = re.compile(
-    r"\b(not|don't|doesn't|can't|cannot|won't|shouldn't|isn't|aren't)\b",
-    re.IGNORECASE,
-)
+# Hyperscan scratch space can't be shared by concurrent scans, and queries
+# are classified on worker threads, so each thread clones its own.
+_thread_local = threading.local()
 
-_SUBCLAUSE_INDICATORS = re.compile(
-    r"(;|—|--|however|but\b|although|whereas|nevertheless|furthermore|moreover|on the other hand)",
-    re.IGNORECASE,
-)
 
-_MULTI_ENTITY = re.compile(
-    r"\b(and|both|all|each|every|multiple|several)\b",
-    re.IGNORECASE,
-)
+def _match_signals(query: str) -> set[int]:
+    """Return the ids of every signal pattern found in the query."""
+    if _HS_DB is None:
+        return {sid for sid, regex in _SIGNAL_REGEXES.items() if regex.search(query)}
+
+    scratch = getattr(_thread_local, "scratch", None)
+    if scratch is None:
+        scratch = _thread_local.scratch = _HS_SCRATCH.clone()
+
+    matched: set[int] = set()
+    _HS_DB.scan(
+        query.encode(), match_event_handler=_on_match, context=matched, scratch=scratch,
+    )
+    return matched
+
+
+def _on_match(signal_id, start, end, flags, matched):
+    matched.add(signal_id)
 
 
 def classify_query(query: str) -> dict:
@@ -55,11 +98,25 @@ def classify_query(query: str) -> dict:
         "signals": list[str],   # which signals fired
         "model": str,           # model to use
     }
+
+    Repeated queries are served from an LRU cache; each call gets a fresh dict.
     """
+    classification, score, signals, model = _classify_cached(query)
+    return {
+        "classification": classification,
+        "score": score,
+        "signals": list(signals),
+        "model": model,
+    }
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def _classify_cached(query: str) -> tuple[str, int, tuple[str, ...], str]:
     score = 0
     signals: list[str] = []
     words = query.split()
     word_count = len(words)
+    matched = _match_signals(query)
 
     # Signal 1: Query length (≥ 15 words → +2)
     if word_count >= 15:
@@ -67,7 +124,7 @@ def classify_query(query: str) -> dict:
         signals.append(f"long_query({word_count} words)")
 
     # Signal 2: Complex keywords (+2)
-    if _COMPLEX_KEYWORDS.search(query):
+    if _COMPLEX_KW in matched:
         score += 2
         signals.append("complex_keyword")
 
@@ -77,22 +134,22 @@ def classify_query(query: str) -> dict:
         signals.append("multi_question_mark")
 
     # Signal 4: Comparison words (+1)
-    if _COMPARISON_WORDS.search(query):
+    if _COMPARISON in matched:
         score += 1
         signals.append("comparison_words")
 
     # Signal 5: Negation in a question (+1)
-    if "?" in query and _NEGATION_QUESTION.search(query):
+    if "?" in query and _NEGATION in matched:
         score += 1
         signals.append("negation_question")
 
     # Signal 6: Sub-clause indicators (+1)
-    if _SUBCLAUSE_INDICATORS.search(query):
+    if _SUBCLAUSE in matched:
         score += 1
         signals.append("subclause_indicator")
 
     # Signal 7: Multiple entities / topics (+1)
-    if _MULTI_ENTITY.search(query) and word_count >= 8:
+    if _MULTI_ENTITY in matched and word_count >= 8:
         score += 1
         signals.append("multi_entity")
 
@@ -104,17 +161,13 @@ def classify_query(query: str) -> dict:
         query[:60], score, classification, signals,
     )
 
-    return {
-        "classification": classification,
-        "score": score,
-        "signals": signals,
-        "model": model,
-    }
+    return classification, score, tuple(signals), model
 
 
 def maybe_upgrade_after_retrieval(
     route_result: dict,
     retrieved_chunks: list[dict],
+    store: ChunkStore,
 ) -> dict:
     """
     Post-retrieval override: if initially classified as 'simple' but
@@ -124,15 +177,12 @@ def maybe_upgrade_after_retrieval(
     if route_result["classification"] == "complex":
         return route_result
 
-    unique_docs = set()
-    for item in retrieved_chunks:
-        chunk = item.get("chunk", item)
-        unique_docs.add(chunk.get("source_file", ""))
+    unique_docs = {int(store.source_file_id[item["idx"]]) for item in retrieved_chunks}
 
     if len(unique_docs) >= MULTI_DOC_THRESHOLD:
         logger.info(
             "Router upgrade: simple→complex (chunks from %d docs: %s)",
-            len(unique_docs), unique_docs,
+            len(unique_docs), {store.filenames[fid] for fid in unique_docs},
         )
         route_result = route_result.copy()
         route_result["classification"] = "complex"
@@ -1,7 +1,23 @@
 from sentence_transformers import SentenceTransformer
+from pathlib import Path
 import os
 
 model_name = os.getenv("EMBEDDING_MODEL", "multi-qa-MiniLM-L6-cos-v1")
 print(f"Downloading model: {model_name}")
 model = SentenceTransformer(model_name)
 print("Model downloaded successfully.")
+
+# Export an ONNX copy for ONNX Runtime inference (see app/embeddings.py).
+# Optional: the app falls back to the sentence-transformers model without it.
+onnx_dir = Path(__file__).resolve().parent / "onnx_model"
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    print(f"Exporting ONNX model to: {onnx_dir}")
+    hub_id = f"sentence-transformers/{model_name}"
+    ORTModelForFeatureExtraction.from_pretrained(hub_id, export=True).save_pretrained(onnx_dir)
+    AutoTokenizer.from_pretrained(hub_id).save_pretrained(onnx_dir)
+    print("ONNX model exported successfully.")
+except ImportError:
+    print("optimum not installed — skipping ONNX export.")